@@ -1,50 +1,270 @@
 
-from collections import deque
+from decimal import Decimal
+from fractions import Fraction
+from itertools import compress
+import math
 import random
-from typing import Iterable
+from typing import Optional
+
+# numpy is only needed for large inputs, so load_numpy imports it on first
+# use; False records that the import failed.
+np = None
+
+# Below this many elements converting to an array costs more than it saves.
+NUMPY_CUTOFF = 1000
+# Windows larger than this are first narrowed with a Floyd-Rivest sample.
+FLOYD_RIVEST_CUTOFF = 600
+# Inputs and quickselect windows smaller than this are sorted outright.
+SORT_CUTOFF = 32
+# Timsort compares ints and floats so cheaply that, without numpy, sorting
+# them beats any Python-level selection up to about this many elements.
+NUMERIC_SORT_CUTOFF = 3000
+# median brackets inputs at least this large with a random sample first.
+SAMPLE_CUTOFF = 500
+
+# A private generator, bound once, so median neither pays for the module
+# level lookup on each retry nor advances the caller's random stream.
+_sample = random.Random().sample
 
 
 class StatisticsError(ValueError):
     pass
 
 
-def partition(q: deque, left: int, right: int, pivot_index: int):
+def median3(a: list, i: int, j: int, k: int):
+    """Return whichever of the indices i, j, k holds the median of the three values.
     """
+    x, y, z = a[i], a[j], a[k]
+    if x < y:
+        if y < z:
+            return j
+        return k if x < z else i
+    if x < z:
+        return i
+    return k if y < z else j
+
+
+def partition3(a: list, left: int, right: int, pivot_index: int):
+    """Three-way partition of a[left:right+1] around a[pivot_index].
+
+    Return (lt, gt) such that a[left:lt] < pivot, a[lt:gt+1] == pivot and
+    a[gt+1:right+1] > pivot, so runs of duplicates are settled in one pass.
     """
-    pivot_value = q[pivot_index]
-    q[pivot_index], q[right] = q[right], q[pivot_index]
-    store_index = left
-    for i, value in enumerate(q[j] for j in range(left, right)):
+    pivot_value = a[pivot_index]
+    lt = i = left
+    gt = right
+    while i <= gt:
+        value = a[i]
         if value < pivot_value:
-            q[store_index], q[i] = q[i], q[store_index]
-            store_index += 1
-    q[right], q[store_index] = q[store_index], q[right]
-    return store_index
+            a[i] = a[lt]
+            a[lt] = value
+            lt += 1
+            i += 1
+        elif pivot_value < value:
+            a[i] = a[gt]
+            a[gt] = value
+            gt -= 1
+        else:
+            i += 1
+    return lt, gt
+
+
+def partition_numeric(a: list, left: int, right: int, pivot_index: int):
+    """partition3 for data made only of exact ints or only of exact floats.
+
+    The scans run as list comprehensions instead of a Python-level loop.
+    """
+    pivot_value = a[pivot_index]
+    window = a[left:right+1]
+    less = [x for x in window if x < pivot_value]
+    greater = [x for x in window if pivot_value < x]
+    # Keep the actual elements (-0.0 vs 0.0, NaNs), not copies of the pivot.
+    equal = [x for x in window if not (x < pivot_value or pivot_value < x)]
+    lt = left + len(less)
+    gt = right - len(greater)
+    less += equal
+    less += greater
+    a[left:right+1] = less
+    return lt, gt
 
 
-def quickselect(l: Iterable, left: int, right: int, k: int):
+def quickselect(a: list, left: int, right: int, k: int, partition=partition3):
     """
     """
-    q = l
-    if not isinstance(l, deque):
-        q = deque(l)
-    if left == right:
-        return q[left]
-    pivot_index = partition(q, left, right, random.randint(left, right))
-    if k == pivot_index:
-        return q[k]
-    elif k < pivot_index:
-        return quickselect(q, left, pivot_index-1, k)
-    else:
-        return quickselect(q, pivot_index+1, right, k)
+    # Introselect: once the partitions stop shrinking fast enough, sort what
+    # is left so adversarial input cannot push us towards O(n**2). Small
+    # windows are sorted as well, as Timsort beats partitioning them.
+    depth_limit = 2 * (right - left + 1).bit_length()
+    while left < right:
+        if depth_limit == 0 or right - left < SORT_CUTOFF:
+            a[left:right+1] = sorted(a[left:right+1])
+            break
+        depth_limit -= 1
+        if right - left > FLOYD_RIVEST_CUTOFF:
+            # Floyd-Rivest: select k within a small window around its
+            # expected position, then partition the whole range on a[k].
+            n = right - left + 1
+            m = k - left + 1
+            z = math.log(n)
+            s = 0.5 * math.exp(2 * z / 3)
+            sd = 0.5 * math.sqrt(z * s * (n - s) / n)
+            if m < n / 2:
+                sd = -sd
+            new_left = max(left, int(k - m * s / n + sd))
+            new_right = min(right, int(k + (n - m) * s / n + sd))
+            quickselect(a, new_left, new_right, k, partition)
+            pivot_index = k
+        else:
+            pivot_index = median3(a, left, (left + right) // 2, right)
+        lt, gt = partition(a, left, right, pivot_index)
+        if k < lt:
+            right = lt - 1
+        elif k > gt:
+            left = gt + 1
+        else:
+            return a[k]
+    return a[k]
+
+
+def load_numpy():
+    """Return the numpy module, importing it on first use, or None if it is
+    not installed.
+    """
+    global np
+    if np is None:
+        try:
+            import numpy as np
+        except ImportError:
+            np = False
+    return np or None
+
+
+def numpy_median(data: list, n: int, kind: type):
+    """Median of data made only of exact ints or only of exact floats
+    (as given by kind), using numpy.partition.
 
-def median(data):
-    data = list(data)
+    Return None if numpy is not installed or cannot represent the data.
+    """
+    if load_numpy() is None:
+        return None
+    arr = np.asarray(data)
+    # numpy falls back to float64 for ints that fit no integer dtype (such
+    # as -1 next to 2**63 + 1), which would round them.
+    if arr.dtype.kind not in ("iu" if kind is int else "f"):
+        return None
+    i = n // 2
+    if n % 2 == 1:
+        return np.partition(arr, i)[i].item()
+    part = np.partition(arr, [i-1, i])
+    # Average as Python scalars so the result matches the pure-Python path.
+    return (part[i-1].item() + part[i].item()) / 2
+
+
+def sample_select(data: list, lo_rank: int, hi_rank: int, tries: int = 3,
+                  keys: Optional[list] = None):
+    """Return the values of rank lo_rank and hi_rank in data, or None.
+
+    Bounds bracketing both ranks are read off a sorted random sample of
+    about n**(2/3) elements; one scan then counts the values below the
+    bracket and collects those inside it, and only that narrow band is
+    sorted. data is not modified. None means every sample missed.
+
+    If given, keys must be floats that order data monotonically (such as
+    float(x) for each x); the bracketing then runs on the keys and only
+    the band is compared exactly.
+    """
+    n = len(data)
+    k = round(n ** (1/3))
+    m = k * k
+    margin = round(1.3 * k)
+    for _ in range(tries):
+        sample = _sample(data if keys is None else keys, m)
+        sample.sort()
+        lo_index = lo_rank * m // n - margin
+        hi_index = hi_rank * m // n + margin
+        if keys is None:
+            band = data
+            below = 0
+            if lo_index >= 0:
+                lo = sample[lo_index]
+                band = [x for x in band if not x < lo]
+                below = n - len(band)
+            if hi_index < m:
+                hi = sample[hi_index]
+                band = [x for x in band if not hi < x]
+        else:
+            lo = sample[lo_index] if lo_index >= 0 else -math.inf
+            hi = sample[hi_index] if hi_index < m else math.inf
+            below = sum(1 for key in keys if key < lo)
+            band = list(compress(data, [lo <= key <= hi for key in keys]))
+        if below <= lo_rank and hi_rank < below + len(band):
+            band = sorted(band)
+            return band[lo_rank - below], band[hi_rank - below]
+    return None
+
+
+def sorted_median(data: list, n: int):
+    """Median of data found by sorting it in place.
+    """
+    data.sort()
+    i = n // 2
+    if n % 2 == 1:
+        return data[i]
+    return (data[i-1] + data[i]) / 2
+
+
+def median(data, _inplace=False):
+    """Return the median (middle value) of numeric data.
+
+    With _inplace=True a list argument is used as the working buffer
+    instead of being copied, and may be reordered afterwards.
+    """
+    if not (_inplace and isinstance(data, list)):
+        data = list(data)
     n = len(data)
     if n == 0:
         raise StatisticsError("No median for empty data")
+    # Going by the first element alone is enough here: sorting is correct
+    # for any data, this only decides whether it is also the fastest way.
+    # Decimals compare in C too, but not cheaply enough to beat
+    # sample_select once it takes over.
+    first = type(data[0])
+    if (n < SORT_CUTOFF
+            or (first in (int, float) and n < NUMERIC_SORT_CUTOFF
+                and (n < NUMPY_CUTOFF or load_numpy() is None))
+            or (n < SAMPLE_CUTOFF and first is Decimal)):
+        return sorted_median(data, n)
+    # Only exact int or float data gets the numeric fast paths: subclasses,
+    # Fraction and Decimal must come back as their own type.
+    kinds = set(map(type, data))
+    numeric = kinds == {int} or kinds == {float}
+    if numeric and n >= NUMPY_CUTOFF:
+        result = numpy_median(data, n, type(data[0]))
+        if result is not None:
+            return result
+    if numeric and n < NUMERIC_SORT_CUTOFF:
+        return sorted_median(data, n)
+    i = n // 2
+    if n >= SAMPLE_CUTOFF:
+        keys = None
+        if kinds == {Fraction}:
+            # Fraction comparisons run in Python; floats order them the same
+            # way (ties aside), so bracket on float keys and compare exactly
+            # only inside the band.
+            try:
+                keys = list(map(float, data))
+            except OverflowError:
+                pass
+        result = sample_select(data, i - (n % 2 == 0), i, keys=keys)
+        if result is not None:
+            if n % 2 == 1:
+                return result[1]
+            return (result[0] + result[1]) / 2
+    partition = partition_numeric if numeric else partition3
     if n % 2 == 1:
-        return quickselect(data, 0, n-1, n//2)
+        return quickselect(data, 0, n-1, i, partition)
     else:
-        i = n // 2
-        return (quickselect(data, 0, n-1, i-1) + quickselect(data, 0, n-1, i)) / 2
+        # Selecting i leaves every smaller value in data[:i], so the
+        # lower middle value is simply the largest of that prefix.
+        upper = quickselect(data, 0, n-1, i, partition)
+        return (max(data[:i]) + upper) / 2
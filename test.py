@@ -1,9 +1,13 @@
 
+import itertools
 import random
+import statistics as stdlib_statistics
 import unittest
 
+from collections import Counter
 from decimal import Decimal
 from fractions import Fraction
+from unittest import mock
 
 import quickselect as statistics
 
@@ -308,6 +312,57 @@ class TestMedian(NumericTestCase, AverageMixin):
         random.shuffle(data)
         self.assertEqual(self.func(data), D('3.65'))
 
+    def test_adversarial_orderings(self):
+        # Test median agrees with statistics.median on presorted input.
+        for n in (99, 100):
+            for data in (list(range(n)), list(range(n, 0, -1))):
+                with self.subTest(n=n, first=data[0]):
+                    expected = stdlib_statistics.median(data)
+                    self.assertEqual(self.func(data), expected)
+
+    def test_large_ints_beyond_int64(self):
+        # Test ints numpy can only hold as float64 are not rounded.
+        for data in ([-1] + [2**63 + 1]*1500, [-1] + [2**63 + 1]*1501):
+            with self.subTest(n=len(data)):
+                expected = stdlib_statistics.median(data)
+                result = self.func(data)
+                self.assertEqual(result, expected)
+                self.assertIs(type(result), type(expected))
+
+    def test_without_numpy(self):
+        # Test large numeric data is still handled when numpy is missing.
+        with mock.patch.object(statistics, 'np', False):
+            for n in (2001, 2000, 4001, 4000):
+                for kind in (int, float):
+                    data = [kind(random.randrange(-10**6, 10**6))
+                            for _ in range(n)]
+                    with self.subTest(n=n, kind=kind):
+                        expected = stdlib_statistics.median(data)
+                        self.assertEqual(self.func(data), expected)
+
+    def test_inplace(self):
+        # Test median can reuse a list argument as its working buffer.
+        data = self.prepare_data()
+        expected = self.func(data)
+        saved = sorted(data)
+        assert data != saved
+        self.assertEqual(self.func(data, _inplace=True), expected)
+        # The list was used as the buffer: still the same values, but
+        # reordered so that the median now sits in the middle.
+        self.assertListEqual(sorted(data), saved)
+        self.assertEqual(data[len(data)//2], expected)
+
+    def test_large_data(self):
+        # Test median agrees with statistics.median on large inputs.
+        for n in (2001, 2000):
+            for kind in (int, float, Fraction, Decimal):
+                data = [kind(random.randrange(-10**6, 10**6)) for _ in range(n)]
+                with self.subTest(n=n, kind=kind):
+                    expected = stdlib_statistics.median(data)
+                    result = self.func(data)
+                    self.assertEqual(result, expected)
+                    self.assertIs(type(result), type(expected))
+
 
 class TestMedianDataType(NumericTestCase, UnivariateTypeMixin):
     # Test conservation of data element type for median.
@@ -322,6 +377,148 @@ class TestMedianDataType(NumericTestCase, UnivariateTypeMixin):
         return data
 
 
+class TestQuickselect(unittest.TestCase):
+    # Test the selection building blocks directly: median only reaches
+    # them for some types and sizes.
+
+    def test_partition_numeric_keeps_elements(self):
+        # Test equal-to-pivot values are kept, not replaced by the pivot.
+        data = [0.0, -0.0] * 600 + [float('nan')] * 300 + [1.0, -1.0] * 50
+        random.shuffle(data)
+        a = data[:]
+        statistics.partition_numeric(a, 0, len(a)-1, 0)
+        self.assertEqual(Counter(map(repr, a)), Counter(map(repr, data)))
+
+    partitions = (statistics.partition3, statistics.partition_numeric)
+
+    def check_quickselect(self, data, k):
+        # Select rank k with each partition scheme and check the result
+        # against sorting, plus the ordering median relies on afterwards.
+        expected = sorted(data)
+        for partition in self.partitions:
+            with self.subTest(partition=partition.__name__, n=len(data), k=k):
+                a = data[:]
+                result = statistics.quickselect(a, 0, len(a)-1, k, partition)
+                self.assertEqual(result, expected[k])
+                self.assertEqual(a[k], expected[k])
+                self.assertListEqual(sorted(a), expected)
+                if k > 0:
+                    self.assertLessEqual(max(a[:k]), a[k])
+                if k < len(a) - 1:
+                    self.assertLessEqual(a[k], min(a[k+1:]))
+
+    def test_median3(self):
+        # Test median3 picks the index of the middle value.
+        for values in itertools.product(range(3), repeat=3):
+            a = list(values)
+            self.assertEqual(a[statistics.median3(a, 0, 1, 2)], sorted(a)[1])
+
+    def test_partition3(self):
+        # Test partition3 splits a window into <, == and > runs.
+        data = [random.randrange(5) for _ in range(100)]
+        for partition in self.partitions:
+            a = data[:]
+            lt, gt = partition(a, 10, 89, 50)
+            pivot = a[lt]
+            self.assertListEqual(a[:10], data[:10])
+            self.assertListEqual(a[90:], data[90:])
+            self.assertTrue(all(x < pivot for x in a[10:lt]))
+            self.assertTrue(all(x == pivot for x in a[lt:gt+1]))
+            self.assertTrue(all(x > pivot for x in a[gt+1:90]))
+            self.assertListEqual(sorted(a), sorted(data))
+
+    def test_quickselect_random(self):
+        # Test selection of the extremes and middle ranks of random data.
+        for n in (1, 2, 31, 32, 33, 100, 599):
+            data = [random.randrange(-10**6, 10**6) for _ in range(n)]
+            for k in {0, n//2 - 1, n//2, n - 1} - {-1}:
+                self.check_quickselect(data, k)
+
+    def test_quickselect_window(self):
+        # Test only a[left:right+1] is searched and rearranged.
+        data = [random.randrange(1000) for _ in range(200)]
+        for partition in self.partitions:
+            a = data[:]
+            result = statistics.quickselect(a, 50, 149, 100, partition)
+            self.assertEqual(result, sorted(data[50:150])[50])
+            self.assertListEqual(a[:50], data[:50])
+            self.assertListEqual(a[150:], data[150:])
+
+    def test_quickselect_presorted(self):
+        # Test presorted and reversed input.
+        for n in (99, 100, 2001):
+            for data in (list(range(n)), list(range(n, 0, -1))):
+                self.check_quickselect(data, n//2)
+
+    def test_quickselect_duplicates(self):
+        # Test duplicate-heavy and all-equal input.
+        for n in (100, 2001):
+            self.check_quickselect([random.randrange(5) for _ in range(n)], n//2)
+            self.check_quickselect([7] * n, n//2)
+
+    def test_quickselect_floyd_rivest(self):
+        # Test windows wider than FLOYD_RIVEST_CUTOFF are narrowed first.
+        n = 4 * statistics.FLOYD_RIVEST_CUTOFF + 1
+        data = [random.random() for _ in range(n)]
+        quickselect = statistics.quickselect
+        with mock.patch.object(
+                statistics, 'quickselect', wraps=quickselect) as spy:
+            # The inner call on the narrowed window goes through the spy.
+            for partition in self.partitions:
+                a = data[:]
+                result = quickselect(a, 0, n-1, n//2, partition)
+                self.assertEqual(result, sorted(data)[n//2])
+        self.assertTrue(spy.called)
+        self.check_quickselect(data, n//2)
+
+    def test_quickselect_depth_limit(self):
+        # Test organ-pipe input falls back to sorting a wide window.
+        n = 300
+        data = list(range(n//2)) + list(range(n//2 - 1, -1, -1))
+        with mock.patch.object(
+                statistics, 'sorted', create=True, wraps=sorted) as spy:
+            self.check_quickselect(data, n//2)
+        widths = [len(call.args[0]) for call in spy.call_args_list]
+        self.assertGreaterEqual(max(widths), statistics.SORT_CUTOFF)
+
+    @staticmethod
+    def bad_sample(data, m):
+        # A sample whose bracket can never contain the middle ranks.
+        return [max(data)] * m
+
+    def test_sample_select_retries(self):
+        # Test a missed bracket is retried with a fresh sample.
+        data = [Decimal(random.randrange(10**6)) for _ in range(2001)]
+        # Miss with the first sample, then take evenly spaced values.
+        calls = []
+        def flaky_sample(population, k):
+            calls.append(k)
+            if len(calls) == 1:
+                return self.bad_sample(population, k)
+            return sorted(population)[::len(population) // k][:k]
+        with mock.patch.object(statistics, '_sample', flaky_sample):
+            result = statistics.sample_select(data, 1000, 1000)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(result, (sorted(data)[1000],) * 2)
+
+    def test_sample_select_gives_up(self):
+        # Test sample_select reports failure instead of guessing.
+        data = list(range(1000))
+        self.assertIsNone(statistics.sample_select(data, 500, 500, tries=0))
+        with mock.patch.object(statistics, '_sample', self.bad_sample):
+            self.assertIsNone(statistics.sample_select(data, 499, 500))
+
+    def test_median_falls_back_when_sampling_fails(self):
+        # Test median still selects exactly when every sample misses.
+        with mock.patch.object(statistics, '_sample', self.bad_sample):
+            for n in (2001, 2000):
+                for kind in (Decimal, Fraction):
+                    data = [kind(random.randrange(10**6)) for _ in range(n)]
+                    with self.subTest(n=n, kind=kind):
+                        expected = stdlib_statistics.median(data)
+                        self.assertEqual(statistics.median(data), expected)
+
+
 # class TestMedianLow(TestMedian, UnivariateTypeMixin):
 #     def setUp(self):
 #         self.func = statistics.median_low